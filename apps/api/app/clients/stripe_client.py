@@ -0,0 +1,7 @@
+import stripe
+from app.config import settings
+
+# Single place the Stripe SDK is imported and configured; import `stripe` from here
+stripe.api_key = settings.STRIPE_SECRET_KEY
+
+__all__ = ["stripe"]
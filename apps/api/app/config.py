@@ -21,6 +21,9 @@ class Settings(BaseSettings):
     # Clerk Authentication
     CLERK_DOMAIN: str
     CLERK_AUDIENCE: str
+    JWKS_CACHE_TTL: int = 3600
+    JWT_CACHE_MAX_TTL: int = 600
+    JWT_CACHE_MAX_SIZE: int = 10000
     
     class Config:
         env_file = ".env"
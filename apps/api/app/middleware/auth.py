@@ -1,38 +1,185 @@
 from fastapi import HTTPException, Header, Depends
-from jose import JWTError, jwt
-from typing import Optional, Dict, Any
+from jwt import InvalidTokenError, PyJWK, PyJWTError
+from types import MappingProxyType
+from typing import Optional, Dict, Any, List, Mapping, Tuple
+import asyncio
+import hashlib
+import time
 import httpx
+import jwt
 import structlog
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
 from app.config import settings
 
 logger = structlog.get_logger(__name__)
 
+# Minimum seconds between forced JWKS refreshes triggered by unknown kids
+JWKS_FORCED_REFRESH_INTERVAL = 30
+# Seconds before expiry at which the background task refreshes the JWKS
+JWKS_REFRESH_MARGIN = 30
+# Allowed clock skew in seconds when checking exp/nbf claims
+JWT_CLOCK_SKEW = 5
+# Minimum seconds between sweeps of expired entries from the token cache
+TOKEN_CACHE_SWEEP_INTERVAL = 60
+
+# Shared client so JWKS refreshes reuse a warm connection (closed on app shutdown)
+http_client = httpx.AsyncClient(
+    http2=True,
+    timeout=5.0,
+    limits=httpx.Limits(max_connections=10)
+)
+
+def _is_transient_http_error(error: BaseException) -> bool:
+    """Network failures and 5xx responses are worth retrying; 4xx responses are not"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+@retry(
+    retry=retry_if_exception(_is_transient_http_error),
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=0.2, max=2),
+    reraise=True
+)
+async def _fetch_jwks() -> Dict[str, Any]:
+    """Fetch JWKS from Clerk as prebuilt keys indexed by kid, retrying transient failures with backoff"""
+    response = await http_client.get(f"https://clerk.{settings.CLERK_DOMAIN}/.well-known/jwks.json")
+    response.raise_for_status()
+    return _build_rs256_keys(response.json()["keys"])
+
+def _build_rs256_keys(jwks_keys: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Construct RSA key objects by kid once per refresh, skipping keys unusable for RS256"""
+    keys = {}
+    for key_data in jwks_keys:
+        if (
+            key_data.get("kty") != "RSA"
+            or key_data.get("alg", "RS256") != "RS256"
+            or key_data.get("use", "sig") != "sig"
+        ):
+            logger.info("Skipping non-RS256 JWKS key", kid=key_data.get("kid"))
+            continue
+        
+        try:
+            keys[key_data["kid"]] = PyJWK(key_data, algorithm="RS256").key
+        except (PyJWTError, KeyError, ValueError) as e:
+            logger.warning("Skipping invalid JWKS key", kid=key_data.get("kid"), error=str(e))
+    
+    return keys
+
 class ClerkAuth:
     """Minimal JWT authentication for Clerk"""
     
     def __init__(self):
-        self.jwks_cache: Optional[Dict[str, Any]] = None
+        # JWKS keys indexed by kid, with their expiry time: (expires_at, {kid: key})
+        self.jwks_cache: Optional[Tuple[float, Dict[str, Any]]] = None
+        self.jwks_fetched_at: float = 0.0
+        self.jwks_fetch_attempts: int = 0
+        self.jwks_lock = asyncio.Lock()
+        # Verified, read-only user data keyed by SHA-256 of the raw token: {key: (expires_at, user_data)}
+        self.token_cache: Dict[bytes, Tuple[float, Mapping[str, Any]]] = {}
+        self.token_cache_swept_at: float = 0.0
+    
+    def _get_cached_user(self, key: bytes) -> Optional[Mapping[str, Any]]:
+        """Return cached user data for a token hash if it has not expired"""
+        entry = self.token_cache.get(key)
+        if entry is None:
+            return None
+        
+        expires_at, user_data = entry
+        if expires_at <= time.time():
+            self.token_cache.pop(key, None)
+            return None
+        
+        return user_data
     
-    async def get_jwks(self) -> Dict[str, Any]:
-        """Get JWKS from Clerk (cached)"""
+    def _cache_user(self, key: bytes, payload: Dict[str, Any], user_data: Mapping[str, Any]) -> None:
+        """Cache verified user data until the token expires (capped at JWT_CACHE_MAX_TTL)"""
+        now = time.time()
+        ttl = min(payload.get("exp", now) - now, settings.JWT_CACHE_MAX_TTL)
+        if ttl <= 0:
+            return
+        
+        # Sweep expired entries occasionally rather than on every insert
+        if now - self.token_cache_swept_at >= TOKEN_CACHE_SWEEP_INTERVAL:
+            self.token_cache = {
+                k: v for k, v in self.token_cache.items() if v[0] > now
+            }
+            self.token_cache_swept_at = now
+        
+        if len(self.token_cache) >= settings.JWT_CACHE_MAX_SIZE:
+            # Evict the oldest insertion
+            self.token_cache.pop(next(iter(self.token_cache)))
+        
+        self.token_cache[key] = (now + ttl, user_data)
+    
+    def _cached_jwks(self, force_refresh: bool) -> Optional[Dict[str, Any]]:
+        """Return cached JWKS keys if they can be used without fetching"""
         if self.jwks_cache is None:
+            return None
+        
+        expires_at, jwks = self.jwks_cache
+        now = time.time()
+        if force_refresh:
+            # Throttle forced refreshes so unknown kids can't hammer Clerk
+            if now - self.jwks_fetched_at < JWKS_FORCED_REFRESH_INTERVAL:
+                return jwks
+        elif expires_at > now:
+            return jwks
+        return None
+    
+    async def get_jwks(self, force_refresh: bool = False) -> Dict[str, Any]:
+        """Get JWKS keys by kid from Clerk (cached for JWKS_CACHE_TTL seconds)"""
+        jwks = self._cached_jwks(force_refresh)
+        if jwks is not None:
+            return jwks
+        
+        # Single-flight: concurrent callers wait for one fetch instead of starting their own
+        attempts_seen = self.jwks_fetch_attempts
+        async with self.jwks_lock:
+            jwks = self._cached_jwks(force_refresh)
+            if jwks is not None:
+                return jwks
+            if self.jwks_fetch_attempts != attempts_seen:
+                # A fetch finished while we waited and didn't produce usable keys
+                if self.jwks_cache is not None:
+                    return self.jwks_cache[1]
+                raise HTTPException(status_code=500, detail="Authentication service unavailable")
+            
             try:
-                async with httpx.AsyncClient() as client:
-                    response = await client.get(f"https://clerk.{settings.CLERK_DOMAIN}/.well-known/jwks.json")
-                    response.raise_for_status()
-                    self.jwks_cache = response.json()
+                jwks = await _fetch_jwks()
             except Exception as e:
                 logger.error("Failed to fetch JWKS", error=str(e))
                 raise HTTPException(status_code=500, detail="Authentication service unavailable")
-        
-        return self.jwks_cache
+            finally:
+                # Counts completed fetches so callers that waited on this one don't repeat it
+                self.jwks_fetch_attempts += 1
+            
+            self.jwks_fetched_at = time.time()
+            self.jwks_cache = (self.jwks_fetched_at + settings.JWKS_CACHE_TTL, jwks)
+            return jwks
+    
+    async def refresh_jwks_periodically(self) -> None:
+        """Background loop that refreshes the JWKS shortly before it expires"""
+        while True:
+            if self.jwks_cache is not None:
+                delay = self.jwks_cache[0] - time.time() - JWKS_REFRESH_MARGIN
+                # Floor the delay so a short JWKS_CACHE_TTL can't spin against the refresh throttle
+                await asyncio.sleep(max(delay, JWKS_FORCED_REFRESH_INTERVAL))
+            
+            try:
+                await self.get_jwks(force_refresh=True)
+            except HTTPException:
+                # Already logged; retry shortly and leave the current keys in place
+                await asyncio.sleep(JWKS_FORCED_REFRESH_INTERVAL)
     
-    async def verify_token(self, token: str) -> Dict[str, Any]:
+    async def verify_token(self, token: str) -> Mapping[str, Any]:
         """Verify JWT token and extract user data"""
+        cache_key = hashlib.sha256(token.encode()).digest()
+        cached_user = self._get_cached_user(cache_key)
+        if cached_user is not None:
+            return cached_user
+        
         try:
-            # Get JWKS for token verification
-            jwks = await self.get_jwks()
-            
             # Decode token header to get kid
             unverified_header = jwt.get_unverified_header(token)
             kid = unverified_header.get("kid")
@@ -40,38 +187,58 @@ class ClerkAuth:
             if not kid:
                 raise HTTPException(status_code=401, detail="Invalid token format")
             
-            # Find the correct key
-            key = None
-            for jwk in jwks["keys"]:
-                if jwk["kid"] == kid:
-                    key = jwk
-                    break
+            # Reject expired or not-yet-valid tokens before paying for signature verification
+            unverified_claims = jwt.decode(token, options={"verify_signature": False})
+            exp = unverified_claims.get("exp", 0)
+            nbf = unverified_claims.get("nbf", 0)
+            if not isinstance(exp, (int, float)) or not isinstance(nbf, (int, float)):
+                raise HTTPException(status_code=401, detail="Invalid token format")
+            
+            now = time.time()
+            if exp < now - JWT_CLOCK_SKEW or nbf > now + JWT_CLOCK_SKEW:
+                raise HTTPException(status_code=401, detail="Invalid or expired token")
+            
+            # Get JWKS for token verification
+            jwks = await self.get_jwks()
+            
+            # Find the correct key, refreshing once in case Clerk rotated its keys
+            key = jwks.get(kid)
+            if not key:
+                jwks = await self.get_jwks(force_refresh=True)
+                key = jwks.get(kid)
             
             if not key:
                 raise HTTPException(status_code=401, detail="Invalid token key")
             
-            # Verify and decode token
+            # Verify and decode token; Clerk's default session tokens carry no aud,
+            # so the audience is only checked when CLERK_AUDIENCE is configured
             payload = jwt.decode(
                 token,
                 key,
                 algorithms=["RS256"],
-                audience=settings.CLERK_AUDIENCE,
-                issuer=f"https://clerk.{settings.CLERK_DOMAIN}"
+                audience=settings.CLERK_AUDIENCE or None,
+                issuer=f"https://clerk.{settings.CLERK_DOMAIN}",
+                leeway=JWT_CLOCK_SKEW,
+                options={"verify_aud": bool(settings.CLERK_AUDIENCE)}
             )
             
-            # Extract user data
-            user_data = {
-                "user_id": payload.get("sub"),
+            user_id = payload.get("sub")
+            if not user_id:
+                raise HTTPException(status_code=401, detail="Invalid token payload")
+            
+            # Read-only so handlers can't mutate the copy shared through the token cache
+            user_data = MappingProxyType({
+                "user_id": user_id,
                 "email": payload.get("email"),
                 "session_id": payload.get("sid")
-            }
-            
-            if not user_data["user_id"]:
-                raise HTTPException(status_code=401, detail="Invalid token payload")
+            })
             
+            self._cache_user(cache_key, payload, user_data)
             return user_data
             
-        except JWTError as e:
+        except HTTPException:
+            raise
+        except InvalidTokenError as e:
             logger.error("JWT verification failed", error=str(e))
             raise HTTPException(status_code=401, detail="Invalid or expired token")
         except Exception as e:
@@ -81,7 +248,7 @@ class ClerkAuth:
 # Global auth instance
 clerk_auth = ClerkAuth()
 
-async def verify_token(authorization: Optional[str] = Header(None)) -> Dict[str, Any]:
+async def verify_token(authorization: Optional[str] = Header(None)) -> Mapping[str, Any]:
     """FastAPI dependency for JWT verification"""
     if not authorization:
         raise HTTPException(status_code=401, detail="Authorization header required")
@@ -1,8 +1,9 @@
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
 from typing import Optional
-import re
 
 class CreateCheckoutSessionRequest(BaseModel):
+    model_config = ConfigDict(str_strip_whitespace=True)
+    
     user_id: Optional[str] = Field(None, description="User ID for the checkout session (populated from JWT)")
     email: Optional[EmailStr] = Field(None, description="Valid email address for the customer (populated from JWT)")
     price_id: str = Field(
@@ -7,38 +7,104 @@ from app.models.stripe import (
 from app.services.stripe_service import StripeService
 from app.config import settings
 from app.middleware.auth import verify_token
-import stripe
+from app.clients.stripe_client import stripe
 import structlog
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
-from typing import Dict, Any
+from typing import Dict, Any, Mapping, Set, Callable, Awaitable, Tuple
+import asyncio
+import time
 import httpx
 
 logger = structlog.get_logger(__name__)
 
-limiter = Limiter(key_func=get_remote_address)
 router = APIRouter()
 
+# Checkout rate limit per user: 10 requests/minute with bursts of up to 10
+CHECKOUT_RATE = 10 / 60
+CHECKOUT_BURST = 10
+# Seconds for an empty bucket to refill completely; idle buckets older than this are full
+CHECKOUT_REFILL_TIME = CHECKOUT_BURST / CHECKOUT_RATE
+# Token buckets per user ID: {user_id: (tokens, last_refill)}
+checkout_buckets: Dict[str, Tuple[float, float]] = {}
+checkout_buckets_swept_at = 0.0
+
+def _allow_checkout(user_id: str) -> bool:
+    """Take a token from the user's bucket, refilling it lazily since the last request"""
+    global checkout_buckets_swept_at
+    now = time.monotonic()
+    
+    # Drop refilled buckets periodically; a missing bucket is treated as full
+    if now - checkout_buckets_swept_at >= CHECKOUT_REFILL_TIME:
+        refilled = [
+            uid for uid, (_, last) in checkout_buckets.items()
+            if now - last >= CHECKOUT_REFILL_TIME
+        ]
+        for uid in refilled:
+            del checkout_buckets[uid]
+        checkout_buckets_swept_at = now
+    
+    tokens, last_refill = checkout_buckets.get(user_id, (CHECKOUT_BURST, now))
+    tokens = min(CHECKOUT_BURST, tokens + (now - last_refill) * CHECKOUT_RATE)
+    if tokens < 1:
+        checkout_buckets[user_id] = (tokens, now)
+        return False
+    
+    checkout_buckets[user_id] = (tokens - 1, now)
+    return True
+
+# Shared keep-alive client for delegating webhooks to the Next.js API (closed on app shutdown)
+frontend_client = httpx.AsyncClient(
+    base_url=settings.FRONTEND_URL,
+    timeout=30.0,
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=20)
+)
+
+# Webhook deliveries to Next.js still running; capped so event bursts can't fan out unbounded
+MAX_INFLIGHT_DELIVERIES = 100
+inflight_deliveries: Set[asyncio.Task] = set()
+
+async def _deliver_to_frontend(event: Dict[str, Any], payload: bytes, signature: str) -> None:
+    """Delegate a webhook event to the Next.js API for database operations"""
+    session = event['data']['object']
+    try:
+        # Forward Stripe's raw body and signature so Next.js can verify the event itself
+        response = await frontend_client.post(
+            "/api/payments/webhook",
+            content=payload,
+            headers={
+                "content-type": "application/json",
+                "stripe-signature": signature
+            }
+        )
+        
+        if response.status_code == 200:
+            logger.info("Successfully delegated webhook to Next.js API", session_id=session['id'])
+        else:
+            logger.error("Failed to delegate webhook to Next.js API", 
+                       session_id=session['id'], status_code=response.status_code)
+                
+    except Exception as e:
+        logger.error("Error delegating webhook to Next.js API", 
+                    session_id=session['id'], error=str(e))
+
 @router.post(
     "/checkout",
     response_model=CreateCheckoutSessionResponse,
     responses={400: {"model": StripeError}}
 )
-@limiter.limit("10/minute")
 async def create_checkout_session(
-    request: Request, 
     data: CreateCheckoutSessionRequest,
-    user: Dict[str, Any] = Depends(verify_token)
+    user: Mapping[str, Any] = Depends(verify_token)
 ):
     """Create a Stripe checkout session for subscription or one-time payment"""
+    if not _allow_checkout(user["user_id"]):
+        logger.warning("Checkout rate limit exceeded", user_id=user["user_id"])
+        raise HTTPException(status_code=429, detail="Too many checkout requests")
+    
     try:
-        # Use user data from JWT instead of request body
-        authenticated_data = CreateCheckoutSessionRequest(
-            user_id=user["user_id"],
-            email=user["email"],
-            price_id=data.price_id,
-            subscription=data.subscription
+        # Use user data from JWT instead of request body; both are already validated
+        authenticated_data = data.model_copy(
+            update={"user_id": user["user_id"], "email": user["email"]}
         )
         
         result = await StripeService.create_checkout_session(authenticated_data)
@@ -66,6 +132,28 @@ async def create_checkout_session(
                     error=str(e), user_id=user["user_id"], price_id=data.price_id)
         raise HTTPException(status_code=500, detail="Payment processing failed")
 
+async def _on_checkout_session_completed(event: Dict[str, Any], payload: bytes, signature: str) -> None:
+    """Schedule delegation of a completed checkout to the Next.js API"""
+    session = event['data']['object']
+    logger.info("Payment succeeded for session", session_id=session['id'])
+    
+    # Delegate in the background so the Stripe ACK isn't blocked on Next.js
+    # Loop since every waiting handler wakes when a single delivery finishes
+    while len(inflight_deliveries) >= MAX_INFLIGHT_DELIVERIES:
+        await asyncio.wait(inflight_deliveries, return_when=asyncio.FIRST_COMPLETED)
+    task = asyncio.create_task(_deliver_to_frontend(event, payload, signature))
+    inflight_deliveries.add(task)
+    task.add_done_callback(inflight_deliveries.discard)
+
+async def _on_unhandled_event(event: Dict[str, Any], payload: bytes, signature: str) -> None:
+    """Log event types the API doesn't act on"""
+    logger.info("Unhandled event type", event_type=event['type'])
+
+# Webhook event type -> async handler taking the verified event, raw payload and signature
+EVENT_HANDLERS: Dict[str, Callable[[Dict[str, Any], bytes, str], Awaitable[None]]] = {
+    "checkout.session.completed": _on_checkout_session_completed,
+}
+
 @router.post("/webhook")
 async def stripe_webhook(request: Request):
     """Handle Stripe webhook events"""
@@ -84,35 +172,8 @@ async def stripe_webhook(request: Request):
     # Log the event for debugging
     logger.info("Received Stripe webhook event", event_type=event['type'])
     
-    # Handle different event types
-    if event['type'] == 'checkout.session.completed':
-        session = event['data']['object']
-        logger.info("Payment succeeded for session", session_id=session['id'])
-        
-        try:
-            # Delegate to Next.js API for database operations
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{settings.FRONTEND_URL}/api/payments/webhook",
-                    json={
-                        "type": event['type'],
-                        "data": event['data']
-                    },
-                    timeout=30.0
-                )
-                
-                if response.status_code == 200:
-                    logger.info("Successfully delegated webhook to Next.js API", session_id=session['id'])
-                else:
-                    logger.error("Failed to delegate webhook to Next.js API", 
-                               session_id=session['id'], status_code=response.status_code)
-                    
-        except Exception as e:
-            logger.error("Error delegating webhook to Next.js API", 
-                        session_id=session['id'], error=str(e))
-        
-    else:
-        logger.info("Unhandled event type", event_type=event['type'])
+    handler = EVENT_HANDLERS.get(event['type'], _on_unhandled_event)
+    await handler(event, payload, sig_header)
     
     return {"status": "success"}
 
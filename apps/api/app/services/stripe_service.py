@@ -1,24 +1,60 @@
-import stripe
+from fastapi.concurrency import run_in_threadpool
+from app.clients.stripe_client import stripe
 from app.config import settings
 from app.models.stripe import CreateCheckoutSessionRequest
+import hashlib
+import hmac
+import time
+import orjson
 import structlog
 
 logger = structlog.get_logger(__name__)
 
-class StripeService:
-    @staticmethod
-    def _initialize_stripe():
-        """Initialize Stripe API key"""
-        stripe.api_key = settings.STRIPE_SECRET_KEY
+# Checkout session parameters that never change at runtime
+SUCCESS_URL = f"{settings.FRONTEND_URL}/success?session_id={{CHECKOUT_SESSION_ID}}"
+CANCEL_URL = f"{settings.FRONTEND_URL}/cancel"
+PAYMENT_METHOD_TYPES = ("card",)
+
+WEBHOOK_SECRET_BYTES = settings.STRIPE_WEBHOOK_SECRET.encode()
+
+def _signature_matches(payload: bytes, signature: str) -> bool:
+    """Check a stripe-signature header against the payload with a single HMAC computation"""
+    timestamp = None
+    candidates = []
+    for item in signature.split(","):
+        name, _, value = item.partition("=")
+        if name == "t":
+            timestamp = value
+        elif name == "v1":
+            candidates.append(value)
     
+    if not timestamp or not timestamp.isdigit() or not candidates:
+        return False
+    if int(timestamp) < time.time() - stripe.Webhook.DEFAULT_TOLERANCE:
+        return False
+    
+    expected = hmac.new(
+        WEBHOOK_SECRET_BYTES, timestamp.encode() + b"." + payload, hashlib.sha256
+    ).hexdigest()
+    return any(hmac.compare_digest(expected, candidate) for candidate in candidates)
+
+class StripeService:
     @staticmethod
     def verify_webhook_signature(payload: bytes, signature: str) -> dict:
-        """Verify Stripe webhook signature and return event"""
+        """Verify Stripe webhook signature and return event as a plain dict"""
         try:
-            event = stripe.Webhook.construct_event(
-                payload, signature, settings.STRIPE_WEBHOOK_SECRET
-            )
-            return event
+            # Signature check only; skips building a stripe.Event object from the payload.
+            # Stripe's own verifier is only used on failure, to raise a descriptive error;
+            # the event is rejected even if it disagrees with the fast check.
+            if not _signature_matches(payload, signature):
+                stripe.WebhookSignature.verify_header(
+                    payload.decode("utf-8"),
+                    signature,
+                    settings.STRIPE_WEBHOOK_SECRET,
+                    tolerance=stripe.Webhook.DEFAULT_TOLERANCE
+                )
+                raise ValueError("Signature does not match the expected signature for payload")
+            return orjson.loads(payload)
         except (ValueError, stripe.error.SignatureVerificationError) as e:
             raise ValueError(f"Webhook signature verification failed: {str(e)}")
     
@@ -33,17 +69,16 @@ class StripeService:
             subscription=data.subscription
         )
         
-        StripeService._initialize_stripe()
         session_params = {
-            "payment_method_types": ["card"],
+            "payment_method_types": list(PAYMENT_METHOD_TYPES),
             "line_items": [{"price": data.price_id, "quantity": 1}],
             "metadata": {
                 "userId": data.user_id,
                 "email": data.email,
                 "subscription": str(data.subscription)
             },
-            "success_url": f"{settings.FRONTEND_URL}/success?session_id={{CHECKOUT_SESSION_ID}}",
-            "cancel_url": f"{settings.FRONTEND_URL}/cancel",
+            "success_url": SUCCESS_URL,
+            "cancel_url": CANCEL_URL,
         }
         
         if data.subscription:
@@ -53,7 +88,8 @@ class StripeService:
             session_params["mode"] = "payment"
         
         try:
-            session = stripe.checkout.Session.create(**session_params)
+            # The SDK call is blocking; keep it off the event loop
+            session = await run_in_threadpool(stripe.checkout.Session.create, **session_params)
             logger.info(
                 "Stripe checkout session created successfully",
                 session_id=session.id,
@@ -1,14 +1,24 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from app.config import settings
 from app.routers import stripe
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
+from app.middleware.auth import clerk_auth, http_client as auth_http_client
+from typing import Dict, Any
+from datetime import datetime
+import asyncio
 import logging
 import time
+import orjson
+import psutil
 import structlog
 
+def orjson_dumps(value: Any, **kwargs: Any) -> str:
+    """JSON serializer for structlog backed by orjson"""
+    return orjson.dumps(
+        value, default=kwargs.get("default"), option=orjson.OPT_NON_STR_KEYS
+    ).decode()
+
 # Configure structured logging
 structlog.configure(
     processors=[
@@ -20,7 +30,7 @@ structlog.configure(
         structlog.processors.StackInfoRenderer(),
         structlog.processors.format_exc_info,
         structlog.processors.UnicodeDecoder(),
-        structlog.processors.JSONRenderer()
+        structlog.processors.JSONRenderer(serializer=orjson_dumps)
     ],
     context_class=dict,
     logger_factory=structlog.stdlib.LoggerFactory(),
@@ -31,36 +41,65 @@ structlog.configure(
 # Get structured logger
 logger = structlog.get_logger()
 
-limiter = Limiter(key_func=get_remote_address)
 app = FastAPI(
     title="RemitMatch API",
     version="0.1.0",
-    description="Backend API for RemitMatch"
+    description="Backend API for RemitMatch",
+    default_response_class=ORJSONResponse
 )
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+
+# System metrics sampled in the background so /health never touches /proc
+SYSTEM_METRICS_INTERVAL = 5
+system_metrics: Dict[str, Any] = {}
+
+async def sample_system_metrics():
+    """Refresh system_metrics every SYSTEM_METRICS_INTERVAL seconds"""
+    while True:
+        system_metrics.update(
+            cpu_percent=psutil.cpu_percent(interval=None),
+            memory_percent=psutil.virtual_memory().percent,
+            disk_percent=psutil.disk_usage('/').percent if hasattr(psutil, 'disk_usage') else None
+        )
+        await asyncio.sleep(SYSTEM_METRICS_INTERVAL)
+
+@app.on_event("startup")
+async def startup_event():
+    app.state.background_tasks = [
+        asyncio.create_task(clerk_auth.refresh_jwks_periodically())
+    ]
+    # System metrics are only reported by /health in development
+    if settings.API_ENV == "development":
+        app.state.background_tasks.append(asyncio.create_task(sample_system_metrics()))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for task in app.state.background_tasks:
+        task.cancel()
+    # Let pending webhook deliveries finish before closing their client
+    await asyncio.gather(*stripe.inflight_deliveries, return_exceptions=True)
+    await auth_http_client.aclose()
+    await stripe.frontend_client.aclose()
+
+# Paths polled by load balancers/uptime checks that don't need request logs
+QUIET_PATHS = {"/", "/health"}
 
 # Request/Response logging middleware
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    start_time = time.time()
-    
-    logger.info(
-        "Request started",
-        method=request.method,
-        path=request.url.path,
-        query_params=str(request.query_params),
-        client_ip=request.client.host if request.client else None,
-        user_agent=request.headers.get("user-agent", "")
-    )
+    if request.url.path in QUIET_PATHS:
+        return await call_next(request)
     
+    start_time = time.perf_counter()
     response = await call_next(request)
+    process_time = time.perf_counter() - start_time
     
-    process_time = time.time() - start_time
     logger.info(
         "Request completed",
         method=request.method,
         path=request.url.path,
+        query_params=str(request.query_params),
+        client_ip=request.client.host if request.client else None,
+        user_agent=request.headers.get("user-agent", ""),
         status_code=response.status_code,
         process_time=round(process_time, 4)
     )
@@ -85,9 +124,6 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    import psutil
-    from datetime import datetime
-    
     start_time = time.time()
     
     health_data = {
@@ -114,10 +150,6 @@ async def health_check():
     
     # Add system metrics in development
     if settings.API_ENV == "development":
-        health_data["system"] = {
-            "cpu_percent": psutil.cpu_percent(),
-            "memory_percent": psutil.virtual_memory().percent,
-            "disk_percent": psutil.disk_usage('/').percent if hasattr(psutil, 'disk_usage') else None
-        }
+        health_data["system"] = dict(system_metrics)
     
     return health_data
\ No newline at end of file
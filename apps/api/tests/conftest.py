@@ -0,0 +1,7 @@
+import os
+
+# Settings require these at import time; use test values when no .env is present
+os.environ.setdefault("STRIPE_SECRET_KEY", "sk_test_dummy")
+os.environ.setdefault("STRIPE_WEBHOOK_SECRET", "whsec_test_secret")
+os.environ.setdefault("CLERK_DOMAIN", "example.com")
+os.environ.setdefault("CLERK_AUDIENCE", "")
@@ -0,0 +1,207 @@
+import asyncio
+import time
+
+import httpx
+import jwt
+import orjson
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from fastapi import HTTPException
+
+from app.config import settings
+from app.middleware import auth as auth_module
+from app.middleware.auth import JWKS_FORCED_REFRESH_INTERVAL, ClerkAuth
+
+KID = "ins_test"
+PRIVATE_KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+def make_auth() -> ClerkAuth:
+    """ClerkAuth with a preloaded JWKS so no network fetch happens"""
+    auth = ClerkAuth()
+    auth.jwks_cache = (time.time() + 3600, {KID: PRIVATE_KEY.public_key()})
+    auth.jwks_fetched_at = time.time()
+    return auth
+
+def make_token(**overrides) -> str:
+    """Clerk-shaped session token (no aud claim by default)"""
+    now = int(time.time())
+    claims = {
+        "sub": "user_123",
+        "sid": "sess_123",
+        "azp": "http://localhost:3000",
+        "iss": f"https://clerk.{settings.CLERK_DOMAIN}",
+        "exp": now + 60,
+        "nbf": now - 5,
+    }
+    claims.update(overrides)
+    return jwt.encode(claims, PRIVATE_KEY, algorithm="RS256", headers={"kid": KID})
+
+def test_verify_token_accepts_token_without_aud(monkeypatch):
+    monkeypatch.setattr(settings, "CLERK_AUDIENCE", "")
+    
+    user = asyncio.run(make_auth().verify_token(make_token()))
+    
+    assert user["user_id"] == "user_123"
+    assert user["session_id"] == "sess_123"
+
+def test_verify_token_checks_aud_when_configured(monkeypatch):
+    monkeypatch.setattr(settings, "CLERK_AUDIENCE", "remitmatch")
+    auth = make_auth()
+    
+    assert asyncio.run(auth.verify_token(make_token(aud="remitmatch")))["user_id"] == "user_123"
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(auth.verify_token(make_token(aud="someone-else")))
+    assert exc_info.value.status_code == 401
+
+def test_token_cache_evicts_oldest_entry_when_full(monkeypatch):
+    monkeypatch.setattr(settings, "JWT_CACHE_MAX_SIZE", 2)
+    auth = make_auth()
+    payload = {"exp": time.time() + 60}
+    
+    for key in (b"a", b"b", b"c"):
+        auth._cache_user(key, payload, {"user_id": key.decode()})
+    
+    assert list(auth.token_cache) == [b"b", b"c"]
+
+def test_token_cache_sweeps_expired_entries():
+    auth = make_auth()
+    auth.token_cache[b"expired"] = (time.time() - 1, {"user_id": "old"})
+    
+    auth._cache_user(b"fresh", {"exp": time.time() + 60}, {"user_id": "new"})
+    
+    assert list(auth.token_cache) == [b"fresh"]
+
+@pytest.mark.parametrize("claims", [{"exp": "soon"}, {"nbf": "later"}, {"exp": None}])
+def test_verify_token_rejects_non_numeric_time_claims(claims):
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(make_auth().verify_token(make_token(**claims)))
+    
+    assert exc_info.value.status_code == 401
+
+def test_verify_token_rejects_expired_token():
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(make_auth().verify_token(make_token(exp=int(time.time()) - 60)))
+    
+    assert exc_info.value.status_code == 401
+
+def test_refresh_loop_sleeps_at_least_the_throttle_interval(monkeypatch):
+    monkeypatch.setattr(settings, "JWKS_CACHE_TTL", 10)
+    auth = make_auth()
+    auth.jwks_cache = (time.time() + 10, auth.jwks_cache[1])
+    delays = []
+    
+    async def fake_sleep(delay):
+        delays.append(delay)
+        if len(delays) == 3:
+            raise asyncio.CancelledError
+    
+    monkeypatch.setattr("app.middleware.auth.asyncio.sleep", fake_sleep)
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(auth.refresh_jwks_periodically())
+    
+    assert min(delays) >= JWKS_FORCED_REFRESH_INTERVAL
+
+def stub_fetch(monkeypatch, result=None, error=None):
+    """Replace the JWKS fetch with a slow stub and return its call log"""
+    calls = []
+    
+    async def fake_fetch():
+        calls.append(time.time())
+        await asyncio.sleep(0.05)
+        if error is not None:
+            raise error
+        return result if result is not None else {KID: PRIVATE_KEY.public_key()}
+    
+    monkeypatch.setattr(auth_module, "_fetch_jwks", fake_fetch)
+    return calls
+
+def test_concurrent_forced_refreshes_fetch_once(monkeypatch):
+    calls = stub_fetch(monkeypatch)
+    auth = make_auth()
+    auth.jwks_fetched_at = 0.0
+    
+    async def run():
+        return await asyncio.gather(*(auth.get_jwks(force_refresh=True) for _ in range(50)))
+    
+    results = asyncio.run(run())
+    
+    assert len(calls) == 1
+    assert all(KID in jwks for jwks in results)
+
+def test_concurrent_cold_start_fetches_once(monkeypatch):
+    calls = stub_fetch(monkeypatch)
+    auth = ClerkAuth()
+    
+    async def run():
+        return await asyncio.gather(*(auth.get_jwks() for _ in range(50)))
+    
+    asyncio.run(run())
+    
+    assert len(calls) == 1
+
+def test_concurrent_failed_fetch_is_not_repeated_by_waiters(monkeypatch):
+    calls = stub_fetch(monkeypatch, error=httpx.ConnectError("down"))
+    auth = ClerkAuth()
+    
+    async def run():
+        return await asyncio.gather(
+            *(auth.get_jwks() for _ in range(20)), return_exceptions=True
+        )
+    
+    results = asyncio.run(run())
+    
+    assert len(calls) == 1
+    assert all(isinstance(r, HTTPException) and r.status_code == 500 for r in results)
+
+def test_build_rs256_keys_skips_unusable_keys():
+    rsa_jwk = orjson.loads(jwt.algorithms.RSAAlgorithm.to_jwk(PRIVATE_KEY.public_key()))
+    ec_key = ec.generate_private_key(ec.SECP256R1()).public_key()
+    ec_jwk = orjson.loads(jwt.algorithms.ECAlgorithm.to_jwk(ec_key))
+    jwks_keys = [
+        {**ec_jwk, "kid": "ec_key", "alg": "ES256", "use": "sig"},
+        {**rsa_jwk, "kid": "enc_key", "use": "enc"},
+        {**rsa_jwk, "kid": "rs512_key", "alg": "RS512"},
+        {**rsa_jwk, "kid": "broken_key", "n": "!!"},
+        {**rsa_jwk, "kid": KID, "alg": "RS256", "use": "sig"},
+    ]
+    
+    keys = auth_module._build_rs256_keys(jwks_keys)
+    
+    assert list(keys) == [KID]
+
+def test_build_rs256_keys_skips_mislabelled_key():
+    ec_key = ec.generate_private_key(ec.SECP256R1()).public_key()
+    ec_jwk = orjson.loads(jwt.algorithms.ECAlgorithm.to_jwk(ec_key))
+    
+    assert auth_module._build_rs256_keys([{**ec_jwk, "kty": "RSA", "kid": "bad"}]) == {}
+
+def mock_clerk(monkeypatch, status_codes):
+    """Serve JWKS requests with the given status codes in order and return the request log"""
+    requests = []
+    
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(status_codes[len(requests) - 1], json={"keys": []})
+    
+    monkeypatch.setattr(auth_module, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(auth_module._fetch_jwks.retry, "sleep", lambda _: asyncio.sleep(0))
+    return requests
+
+@pytest.mark.parametrize("status_code", [404, 429])
+def test_fetch_jwks_does_not_retry_client_errors(monkeypatch, status_code):
+    requests = mock_clerk(monkeypatch, [status_code] * 3)
+    
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(auth_module._fetch_jwks())
+    
+    assert len(requests) == 1
+
+def test_fetch_jwks_retries_server_errors(monkeypatch):
+    requests = mock_clerk(monkeypatch, [503, 502, 200])
+    
+    assert asyncio.run(auth_module._fetch_jwks()) == {}
+    assert len(requests) == 3
+
+def test_transport_errors_are_transient():
+    assert auth_module._is_transient_http_error(httpx.ConnectError("down"))
+    assert not auth_module._is_transient_http_error(ValueError("bad json"))
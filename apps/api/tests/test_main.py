@@ -0,0 +1,7 @@
+from main import orjson_dumps
+
+def test_orjson_dumps_stringifies_non_str_keys():
+    assert orjson_dumps({1: "a", "b": 2}) == '{"1":"a","b":2}'
+
+def test_orjson_dumps_uses_fallback_default():
+    assert orjson_dumps({"value": object()}, default=lambda _: "fallback") == '{"value":"fallback"}'
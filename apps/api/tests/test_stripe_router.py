@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+from app.routers import stripe as stripe_router
+
+EVENT = {"type": "checkout.session.completed", "data": {"object": {"id": "cs_test"}}}
+
+def test_checkout_deliveries_respect_inflight_cap(monkeypatch):
+    monkeypatch.setattr(stripe_router, "MAX_INFLIGHT_DELIVERIES", 2)
+    peak = 0
+    
+    async def fake_deliver(event, payload, signature):
+        nonlocal peak
+        peak = max(peak, len(stripe_router.inflight_deliveries))
+        await asyncio.sleep(0.01)
+    
+    monkeypatch.setattr(stripe_router, "_deliver_to_frontend", fake_deliver)
+    
+    async def run():
+        await asyncio.gather(*(
+            stripe_router._on_checkout_session_completed(EVENT, b"{}", "t=1,v1=x")
+            for _ in range(10)
+        ))
+        await asyncio.gather(*stripe_router.inflight_deliveries)
+    
+    asyncio.run(run())
+    
+    assert peak <= 2
+
+def test_checkout_rate_limit_allows_burst_then_rejects(monkeypatch):
+    monkeypatch.setattr(stripe_router, "checkout_buckets", {})
+    
+    results = [stripe_router._allow_checkout("user_burst") for _ in range(stripe_router.CHECKOUT_BURST + 1)]
+    
+    assert results == [True] * stripe_router.CHECKOUT_BURST + [False]
+
+def test_checkout_rate_limit_drops_refilled_buckets(monkeypatch):
+    now = time.monotonic()
+    monkeypatch.setattr(stripe_router, "checkout_buckets", {
+        "idle_user": (0.0, now - stripe_router.CHECKOUT_REFILL_TIME - 1),
+        "active_user": (5.0, now),
+    })
+    monkeypatch.setattr(stripe_router, "checkout_buckets_swept_at", 0.0)
+    
+    assert stripe_router._allow_checkout("new_user")
+    assert set(stripe_router.checkout_buckets) == {"active_user", "new_user"}
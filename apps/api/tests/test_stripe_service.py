@@ -0,0 +1,76 @@
+import hashlib
+import hmac
+import time
+
+import orjson
+import pytest
+
+from app.config import settings
+from app.services.stripe_service import StripeService, _signature_matches
+
+PAYLOAD = orjson.dumps({"id": "evt_test", "type": "checkout.session.completed"})
+
+def sign(payload: bytes, timestamp: int, secret: str = None) -> str:
+    """Build a stripe-signature header value for a payload"""
+    secret = secret or settings.STRIPE_WEBHOOK_SECRET
+    signed = f"{timestamp}.".encode() + payload
+    return hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+
+def test_verify_webhook_signature_accepts_valid_signature():
+    timestamp = int(time.time())
+    header = f"t={timestamp},v1={sign(PAYLOAD, timestamp)}"
+    
+    event = StripeService.verify_webhook_signature(PAYLOAD, header)
+    
+    assert event["type"] == "checkout.session.completed"
+
+def test_verify_webhook_signature_rejects_stale_signature():
+    timestamp = int(time.time()) - 600
+    header = f"t={timestamp},v1={sign(PAYLOAD, timestamp)}"
+    
+    with pytest.raises(ValueError, match="Timestamp outside the tolerance zone"):
+        StripeService.verify_webhook_signature(PAYLOAD, header)
+
+def test_signature_matches_valid_signature():
+    timestamp = int(time.time())
+    
+    assert _signature_matches(PAYLOAD, f"t={timestamp},v1={sign(PAYLOAD, timestamp)}")
+
+def test_signature_matches_rejects_stale_timestamp():
+    timestamp = int(time.time()) - 600
+    
+    assert not _signature_matches(PAYLOAD, f"t={timestamp},v1={sign(PAYLOAD, timestamp)}")
+
+def test_signature_matches_rejects_wrong_secret():
+    timestamp = int(time.time())
+    signature = sign(PAYLOAD, timestamp, secret="whsec_other_secret")
+    
+    assert not _signature_matches(PAYLOAD, f"t={timestamp},v1={signature}")
+
+def test_signature_matches_any_of_multiple_v1_signatures():
+    timestamp = int(time.time())
+    header = f"t={timestamp},v1={'0' * 64},v0={'1' * 64},v1={sign(PAYLOAD, timestamp)}"
+    
+    assert _signature_matches(PAYLOAD, header)
+
+@pytest.mark.parametrize("header", [
+    "",
+    "garbage",
+    "t=,v1=abc",
+    "t=soon,v1=abc",
+    f"t={int(time.time())}",
+    f"v1={'0' * 64}",
+])
+def test_signature_matches_rejects_malformed_header(header):
+    assert not _signature_matches(PAYLOAD, header)
+
+def test_verify_webhook_signature_rejects_wrong_secret():
+    timestamp = int(time.time())
+    signature = sign(PAYLOAD, timestamp, secret="whsec_other_secret")
+    
+    with pytest.raises(ValueError, match="No signatures found matching"):
+        StripeService.verify_webhook_signature(PAYLOAD, f"t={timestamp},v1={signature}")
+
+def test_verify_webhook_signature_rejects_malformed_header():
+    with pytest.raises(ValueError, match="Unable to extract timestamp"):
+        StripeService.verify_webhook_signature(PAYLOAD, "garbage")